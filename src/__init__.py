@@ -1,24 +1,25 @@
 # 配置常量
 from .config import DB_PATH, LOG_LEVEL, API_HOST, API_PORT, DEBUG
 
-# 数据库连接上下文管理器
-from .db import get_connection
+# 数据库连接上下文管理器，及当前上下文的数据库路径（ContextVar）
+from .db import get_connection, db_path
 
 # 数据模型
 from .models import Antenna, Tag, Record
 
 # 持久层（Repository）函数
 from .repository import (
-    insert_antenna, list_antennas,
-    insert_tag, list_tags, get_tag_by_id,
+    insert_antenna, insert_antennas, list_antennas,
+    insert_tag, insert_tags, list_tags, get_tag_by_id,
     get_records_by_tag, insert_records
 )
 
 # 服务层
 from .services.tagsee import TagSeeClient, collect_and_store_records
 from .services.positioning import (
-    load_data_from_db, load_reference_tags,
-    sliding_window_features, train_rf_models, evaluate_position
+    PositioningDataset, load_data_from_db, load_reference_tags,
+    sliding_window_features, train_rf_models, evaluate_position,
+    persist_predictions
 )
 
 # API 应用实例
@@ -1,12 +1,28 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from .handlers import router as api_router
 from ..config import DEBUG, API_HOST, API_PORT
+from ..db import initialize_database, init_pool, close_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时初始化数据库结构并建立连接池，关闭时释放
+    initialize_database()
+    init_pool()
+    yield
+    close_pool()
+
 
 app = FastAPI(
     title="RFID Indoor Positioning API",
     version="0.1.0",
-    debug=DEBUG
+    debug=DEBUG,
+    lifespan=lifespan,
+    # 使用 orjson 序列化 JSON 响应；导出接口仍为 StreamingResponse
+    default_response_class=ORJSONResponse
 )
 
 # 跨域配置（根据前端域名自行调整）
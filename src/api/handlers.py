@@ -1,18 +1,16 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import StreamingResponse
-from io import StringIO
+from io import StringIO, TextIOWrapper
 import csv
-import pandas as pd
 
 from ..db import get_connection
 from ..repository import (
-    insert_antenna, list_antennas,
-    insert_tag, list_tags, get_tag_by_id,
-    get_records_by_tag
+    insert_antenna, insert_antennas, list_antennas_raw,
+    insert_tag, insert_tags, list_tags, list_tags_raw
 )
 from ..models import Antenna, Tag, Record
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 router = APIRouter()
 
@@ -58,18 +56,39 @@ def create_antenna(antenna: AntennaIn):
         insert_antenna(conn, Antenna(**antenna.model_dump()))
     return {"message": "antenna inserted"}
 
+# CSV 上传按行流式解析，不整体读入内存
+def _read_csv_upload(file: UploadFile):
+    # utf-8-sig 去掉 Excel 导出的 BOM；行尾缺失的单元格按空值补齐
+    reader = csv.reader(TextIOWrapper(file.file, encoding='utf-8-sig', newline=''))
+    header = next(reader, [])
+    width = len(header)
+    rows = (r + [''] * (width - len(r)) for r in reader if r)
+    return {h.strip(): i for i, h in enumerate(header)}, rows
+
+def _missing_column(e: KeyError) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"missing column: {e.args[0]}")
+
+def _optional_float(value: str) -> Optional[float]:
+    return float(value) if value.strip() else None
+
 # 1b. CSV 批量导入天线
 @router.post("/antennas/upload", response_model=None)
 def upload_antennas(file: UploadFile = File(...)):
-    content = file.file.read().decode('utf-8')
-    reader = csv.DictReader(StringIO(content))
-    with get_connection() as conn:
-        for row in reader:
-            insert_antenna(conn, Antenna(
-                antenna_id=row['antenna_id'],
-                x=float(row['x']),
-                y=float(row['y'])
-            ))
+    idx, rows = _read_csv_upload(file)
+    try:
+        i_id, i_x, i_y = idx['antenna_id'], idx['x'], idx['y']
+    except KeyError as e:
+        raise _missing_column(e)
+    antennas = (
+        Antenna(antenna_id=r[i_id], x=float(r[i_x]), y=float(r[i_y]))
+        for r in rows
+    )
+    try:
+        with get_connection() as conn:
+            # 单事务 executemany 边解析边写入
+            insert_antennas(conn, antennas)
+    except (ValueError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": "antennas uploaded"}
 
 # 2. 手动录入单个标签
@@ -88,45 +107,68 @@ def create_tag(tag_in: TagIn):
 # 2b. CSV 批量导入标签
 @router.post("/tags/upload", response_model=None)
 def upload_tags(file: UploadFile = File(...)):
-    df = pd.read_csv(file.file)
-    with get_connection() as conn:
-        for _, row in df.iterrows():
-            insert_tag(conn, Tag(
-                tag_id=row['tag_id'],
-                type=row['type'],
-                true_x=row.get('true_x'),
-                true_y=row.get('true_y')
-            ))
+    idx, rows = _read_csv_upload(file)
+    try:
+        i_id, i_type = idx['tag_id'], idx['type']
+    except KeyError as e:
+        raise _missing_column(e)
+    i_x, i_y = idx.get('true_x'), idx.get('true_y')
+    tags = (
+        Tag(
+            tag_id=r[i_id],
+            type=r[i_type],
+            true_x=_optional_float(r[i_x]) if i_x is not None else None,
+            true_y=_optional_float(r[i_y]) if i_y is not None else None
+        )
+        for r in rows
+    )
+    try:
+        with get_connection() as conn:
+            # 单事务 executemany 边解析边写入，校验失败时整体回滚
+            insert_tags(conn, tags)
+    except (ValueError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": "tags uploaded"}
 
 # 3. 列出所有天线
 @router.get("/antennas/", response_model=List[AntennaOut])
 def get_all_antennas():
     with get_connection() as conn:
-        ants = list_antennas(conn)
-    return [AntennaOut(**a.__dict__) for a in ants]
+        return list_antennas_raw(conn)
 
 # 3b. 列出所有标签及坐标
 @router.get("/tags/", response_model=List[TagOut])
 def get_all_tags():
     with get_connection() as conn:
-        tags = list_tags(conn)
-    return [TagOut(**t.__dict__) for t in tags]
+        return list_tags_raw(conn)
 
 # 4. 获取指定类型标签的读数
 @router.get("/readings/", response_model=List[ReadingOut])
 def get_readings(tag_type: str):
     if tag_type not in ('ref', 'tar'):
         raise HTTPException(status_code=400, detail="type must be 'ref' or 'tar'")
-    out = []
     with get_connection() as conn:
-        tags = list_tags(conn, tag_type)
-        for t in tags:
-            recs = get_records_by_tag(conn, t.tag_id)
-            rssi = [r.rssi for r in recs]
-            rc   = [r.rc   for r in recs]
-            out.append(ReadingOut(tag_id=t.tag_id, rssi=rssi, rc=rc, is_read=t.is_read))
-    return out
+        # 由 SQLite 按标签聚合读数：关联子查询沿 idx_record_tag 按 record_id 顺序扫描，
+        # 无需排序即可保持读数顺序；无读数的标签返回 NULL。
+        # group_concat 直接转文本只保留 15 位有效数字，RSSI 按 17 位格式化以便无损往返
+        rows = conn.execute(
+            "SELECT t.tag_id, t.is_read,"
+            " (SELECT group_concat(printf('%!.17g', rssi)) FROM"
+            "  (SELECT rssi FROM record WHERE tag_id = t.tag_id ORDER BY record_id)),"
+            " (SELECT group_concat(rc) FROM"
+            "  (SELECT rc FROM record WHERE tag_id = t.tag_id ORDER BY record_id))"
+            " FROM tag t WHERE t.type = ? ORDER BY t.rowid",
+            (tag_type,)
+        ).fetchall()
+    return [
+        ReadingOut(
+            tag_id=tag_id,
+            rssi=[float(x) for x in rssi.split(',')] if rssi else [],
+            rc=[int(x) for x in rc.split(',')] if rc else [],
+            is_read=bool(is_read)
+        )
+        for tag_id, is_read, rssi, rc in rows
+    ]
 
 # 5. 获取所有目标标签预测坐标
 @router.get("/predictions/", response_model=List[PredictionOut])
@@ -138,14 +180,29 @@ def get_predictions():
             out.append(PredictionOut(tag_id=t.tag_id, pred_x=t.pred_x, pred_y=t.pred_y))
     return out
 
+# 6. 导出：逐批从游标读取并生成 CSV，避免整表物化
+def _iter_csv(query: str, batch_size: int = 1000) -> Iterator[str]:
+    buf = StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    with get_connection() as conn:
+        cursor = conn.execute(query)
+        writer.writerow([d[0] for d in cursor.description])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
 # 6a. 导出 tag 表
 @router.get("/export/tags")
 def export_tags():
-    with get_connection() as conn:
-        df = pd.read_sql_query("SELECT * FROM tag", conn)
-    csv_data = df.to_csv(index=False)
     return StreamingResponse(
-        StringIO(csv_data),
+        _iter_csv("SELECT * FROM tag"),
         media_type='text/csv',
         headers={'Content-Disposition': 'attachment; filename=tags.csv'}
     )
@@ -153,11 +210,8 @@ def export_tags():
 # 6b. 导出 record 表
 @router.get("/export/records")
 def export_records():
-    with get_connection() as conn:
-        df = pd.read_sql_query("SELECT * FROM record", conn)
-    csv_data = df.to_csv(index=False)
     return StreamingResponse(
-        StringIO(csv_data),
+        _iter_csv("SELECT * FROM record"),
         media_type='text/csv',
         headers={'Content-Disposition': 'attachment; filename=records.csv'}
     )
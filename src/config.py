@@ -19,6 +19,10 @@ API_PORT = int(os.getenv("API_PORT", "8000"))
 # 调试模式开关
 DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
 
+# 随机森林推理使用 ONNX Runtime（需安装 skl2onnx、onnxruntime）。
+# 每个模型首次转换耗时较长，仅在同一模型反复推理时划算
+RF_USE_ONNX = os.getenv("RF_USE_ONNX", "False").lower() in ("true", "1", "yes")
+
 # 其他全局常量，可以在这里继续添加
 # 例如：
 # MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
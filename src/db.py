@@ -1,8 +1,17 @@
 import os
+import queue
 import sqlite3
+import threading
 from contextlib import contextmanager
-from typing import Generator
-from .config import DB_PATH
+from contextvars import ContextVar
+from typing import Dict, Generator, Set
+from . import config
+
+# Database path for the current context (thread / task); defaults to config.DB_PATH.
+# Tests and workers override it with db_path.set(...) / db_path.reset(token).
+# This replaces the former src.db.DB_PATH attribute: assigning src.db.DB_PATH has
+# no effect any more, so callers doing that must switch to db_path.set(...).
+db_path: ContextVar[str] = ContextVar("db_path", default=config.DB_PATH)
 
 _SCHEMA = """
 CREATE TABLE IF NOT EXISTS antenna (
@@ -32,6 +41,8 @@ CREATE TABLE IF NOT EXISTS record (
   rc           INTEGER NOT NULL,
   rssi         REAL    NOT NULL,
   read_time    DATETIME NOT NULL DEFAULT (datetime('now','localtime')),
+  -- Unix timestamp in microseconds, for numeric ordering/windowing without parsing
+  read_ts      INTEGER NOT NULL DEFAULT (CAST(ROUND((julianday('now') - 2440587.5) * 86400000) AS INTEGER) * 1000),
   FOREIGN KEY (tag_id)     REFERENCES tag(tag_id) ON DELETE CASCADE ON UPDATE CASCADE,
   FOREIGN KEY (antenna_id) REFERENCES antenna(antenna_id) ON DELETE RESTRICT ON UPDATE CASCADE
 );
@@ -40,37 +51,189 @@ CREATE INDEX IF NOT EXISTS idx_record_tag     ON record(tag_id);
 CREATE INDEX IF NOT EXISTS idx_record_antenna ON record(antenna_id);
 """
 
+# Set by fast_test_mode(); trades durability for speed on throwaway databases
+_fast_mode = False
+
+# Connections kept per pool, and the page-cache budget (KiB) they share
+POOL_SIZE = 8
+CACHE_BUDGET_KIB = 65536
+
+def _tune_connection(conn: sqlite3.Connection) -> None:
+    if _fast_mode:
+        conn.execute("PRAGMA journal_mode = MEMORY;")
+        conn.execute("PRAGMA synchronous = OFF;")
+    else:
+        conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.execute("PRAGMA busy_timeout = 5000;")
+    conn.execute("PRAGMA mmap_size = 268435456;")
+    # Negative cache_size is in KiB; split the budget across pooled connections
+    conn.execute(f"PRAGMA cache_size = -{CACHE_BUDGET_KIB // POOL_SIZE};")
+
+def fast_test_mode(enabled: bool = True) -> None:
+    """
+    Disable journaling fsyncs (journal_mode=MEMORY, synchronous=OFF) for all
+    pooled connections. Only for disposable databases such as test fixtures.
+    """
+    global _fast_mode
+    _fast_mode = enabled
+    init_pool()
+
+def _read_ts_from(col: str) -> str:
+    """
+    SQL expression converting a read_time text column to read_ts (epoch microseconds).
+    Naive values are local time; values carrying a UTC offset are already absolute.
+    Fractional seconds are taken from the text (isoformat writes six digits),
+    since julianday() only keeps millisecond precision.
+    """
+    return (
+        f"CAST(strftime('%s', {col}, CASE WHEN substr({col}, 20) GLOB '*[+-]*'"
+        f" THEN '+0 seconds' ELSE 'utc' END) AS INTEGER) * 1000000"
+        f" + CASE WHEN substr({col}, 20, 1) = '.'"
+        f" THEN CAST(substr({col}, 21, 6) AS INTEGER) ELSE 0 END"
+    )
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring databases created with an older schema up to date."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(record)")}
+    if "read_ts" not in columns:
+        # ALTER TABLE cannot add a non-constant default; backfill from read_time
+        conn.execute("ALTER TABLE record ADD COLUMN read_ts INTEGER")
+        conn.execute(f"UPDATE record SET read_ts = {_read_ts_from('read_time')}")
+        # Stand-in for the column default on migrated tables
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS record_fill_read_ts AFTER INSERT ON record"
+            " WHEN NEW.read_ts IS NULL BEGIN"
+            f" UPDATE record SET read_ts = {_read_ts_from('NEW.read_time')}"
+            " WHERE record_id = NEW.record_id;"
+            " END"
+        )
+
+def _is_uri(path: str) -> bool:
+    # e.g. "file:test?mode=memory&cache=shared" for in-memory test databases
+    return path.startswith("file:")
+
+# Database paths whose schema has already been created in this process
+_initialized: Set[str] = set()
+
+def _is_memory(path: str) -> bool:
+    # Shared-cache in-memory databases live only while a connection is open
+    return "mode=memory" in path
+
 def initialize_database() -> None:
+    """
+    Create the schema and apply migrations, once per database path per process;
+    later calls for the same path are no-ops.
+    """
+    path = db_path.get()
+    if path in _initialized:
+        return
+    if _is_memory(path):
+        # Pooled connections keep the in-memory database alive past this call
+        _get_pool(path)
     # Ensure the directory for the database exists
-    db_dir = os.path.dirname(DB_PATH)
-    if db_dir and not os.path.exists(db_dir):
+    db_dir = os.path.dirname(path)
+    if not _is_uri(path) and db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(path, uri=_is_uri(path))
     try:
         # Enable foreign key constraints
         conn.execute("PRAGMA foreign_keys = ON;")
+        # WAL journal mode is persistent in the database file
+        conn.execute("PRAGMA journal_mode = WAL;")
         # Create tables and indexes
         conn.executescript(_SCHEMA)
+        _migrate(conn)
         conn.commit()
     finally:
         conn.close()
+    _initialized.add(path)
+
+# Connection pools, one per database path
+_pools: Dict[str, "queue.Queue[sqlite3.Connection]"] = {}
+_pool_lock = threading.Lock()
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, uri=_is_uri(path), check_same_thread=False)
+    # Return rows as sqlite3.Row for name-based access
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    # Per-connection tuning; with WAL, synchronous=NORMAL skips the fsync on commit
+    _tune_connection(conn)
+    return conn
+
+def _drain(pool: "queue.Queue[sqlite3.Connection]") -> None:
+    while True:
+        try:
+            pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+def _new_pool(path: str, size: int) -> "queue.Queue[sqlite3.Connection]":
+    pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+    for _ in range(size):
+        pool.put_nowait(_connect(path))
+    return pool
+
+def init_pool(size: int = POOL_SIZE) -> None:
+    """
+    (Re)create the connection pool for the current database path,
+    pre-opening `size` configured connections.
+    """
+    path = db_path.get()
+    pool = _new_pool(path, size)
+    with _pool_lock:
+        old = _pools.get(path)
+        _pools[path] = pool
+    if old is not None:
+        _drain(old)
+
+def close_pool() -> None:
+    """Close all idle pooled connections and drop every pool."""
+    with _pool_lock:
+        pools = dict(_pools)
+        _pools.clear()
+    for path, pool in pools.items():
+        _drain(pool)
+        if _is_memory(path):
+            _initialized.discard(path)
+
+def _get_pool(path: str) -> "queue.Queue[sqlite3.Connection]":
+    pool = _pools.get(path)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = _new_pool(path, POOL_SIZE)
+    return pool
 
 @contextmanager
 def get_connection() -> Generator[sqlite3.Connection, None, None]:
     """
-    Context manager to provide a SQLite connection with foreign keys enabled.
-    Commits transactions and closes the connection upon exit.
+    Context manager to provide a pooled SQLite connection with foreign keys enabled,
+    for the database path of the current context.
+    Commits on success, rolls back on error, and returns the connection to the pool.
     """
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    # Return rows as sqlite3.Row for name-based access
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
+    path = db_path.get()
+    pool = _get_pool(path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        # Pool exhausted (e.g. nested use): open an overflow connection
+        conn = _connect(path)
     try:
         yield conn
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        conn.close()
-
-# Automatically initialize database schema on import
-initialize_database()
+        if _pools.get(path) is pool:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+        else:
+            # Pool recreated or closed while in use
+            conn.close()
@@ -2,13 +2,13 @@ from dataclasses import dataclass, field
 from typing import Optional
 from datetime import datetime
 
-@dataclass
+@dataclass(slots=True)
 class Antenna:
     antenna_id: str
     x: float
     y: float
 
-@dataclass
+@dataclass(slots=True)
 class Tag:
     tag_id: str
     type: str  # 'ref' or 'tar'
@@ -24,7 +24,7 @@ class Tag:
         if self.type == 'ref' and (self.pred_x is not None or self.pred_y is not None):
             raise ValueError("Reference tags should not have pred_x or pred_y")
 
-@dataclass
+@dataclass(slots=True)
 class Record:
     tag_id: str
     antenna_id: str
@@ -1,15 +1,56 @@
 import sqlite3
-from typing import List, Optional
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
 from datetime import datetime
 from .models import Antenna, Tag, Record
 
+# Insert statements, shared by single-row and batch writers
+INSERT_ANTENNA_SQL = "INSERT OR REPLACE INTO antenna (antenna_id, x, y) VALUES (?, ?, ?)"
+INSERT_TAG_SQL = (
+    "INSERT OR REPLACE INTO tag (tag_id, type, true_x, true_y, pred_x, pred_y, is_read)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_RECORD_SQL = (
+    "INSERT INTO record (tag_id, antenna_id, rc, rssi, read_time, read_ts)"
+    " VALUES (?, ?, ?, ?, ?, ?)"
+)
+# Single-row insert that hands back the generated key in the same statement
+INSERT_RECORD_RETURNING_SQL = INSERT_RECORD_SQL + " RETURNING record_id"
+
+
+def _to_ts(dt: datetime) -> int:
+    """Convert a datetime to a Unix timestamp in microseconds."""
+    return round(dt.timestamp() * 1_000_000)
+
+
+@lru_cache(maxsize=4096)
+def _parse_read_time(text: str) -> datetime:
+    """
+    Parse a stored read_time exactly as written (naive or with its UTC offset).
+    Readings of one frame share a timestamp, so the cache absorbs most calls.
+    """
+    return datetime.fromisoformat(text)
+
+
+def _fetch_tuples(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[tuple]:
+    """Run a query on a plain-tuple cursor, bypassing the connection's row_factory."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params).fetchall()
+
+
 # Antenna CRUD
 
 def insert_antenna(conn: sqlite3.Connection, antenna: Antenna) -> None:
     """Insert or replace an Antenna record."""
-    conn.execute(
-        "INSERT OR REPLACE INTO antenna (antenna_id, x, y) VALUES (?, ?, ?)",
-        (antenna.antenna_id, antenna.x, antenna.y)
+    insert_antennas(conn, (antenna,))
+
+
+def insert_antennas(conn: sqlite3.Connection, antennas: Iterable[Antenna]) -> None:
+    """Batch insert or replace Antenna records; `antennas` may be a lazy iterable."""
+    conn.executemany(
+        INSERT_ANTENNA_SQL,
+        ((a.antenna_id, a.x, a.y) for a in antennas)
     )
 
 
@@ -26,27 +67,30 @@ def get_antenna_by_id(conn: sqlite3.Connection, antenna_id: str) -> Optional[Ant
 
 def list_antennas(conn: sqlite3.Connection) -> List[Antenna]:
     """List all Antenna records."""
-    rows = conn.execute(
-        "SELECT antenna_id, x, y FROM antenna"
-    ).fetchall()
-    return [Antenna(r["antenna_id"], r["x"], r["y"]) for r in rows]
+    rows = _fetch_tuples(conn, "SELECT antenna_id, x, y FROM antenna")
+    return [Antenna(aid, x, y) for aid, x, y in rows]
+
+
+def list_antennas_raw(conn: sqlite3.Connection) -> List[dict]:
+    """List all antennas as plain dicts, for read-only serialization."""
+    rows = _fetch_tuples(conn, "SELECT antenna_id, x, y FROM antenna")
+    return [{"antenna_id": aid, "x": x, "y": y} for aid, x, y in rows]
 
 
 # Tag CRUD
 
 def insert_tag(conn: sqlite3.Connection, tag: Tag) -> None:
     """Insert or replace a Tag record."""
-    conn.execute(
-        "INSERT OR REPLACE INTO tag (tag_id, type, true_x, true_y, pred_x, pred_y, is_read)"
-        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+    insert_tags(conn, (tag,))
+
+
+def insert_tags(conn: sqlite3.Connection, tags: Iterable[Tag]) -> None:
+    """Batch insert or replace Tag records; `tags` may be a lazy iterable."""
+    conn.executemany(
+        INSERT_TAG_SQL,
         (
-            tag.tag_id,
-            tag.type,
-            tag.true_x,
-            tag.true_y,
-            tag.pred_x,
-            tag.pred_y,
-            int(tag.is_read)
+            (t.tag_id, t.type, t.true_x, t.true_y, t.pred_x, t.pred_y, int(t.is_read))
+            for t in tags
         )
     )
 
@@ -68,6 +112,17 @@ def update_tag(conn: sqlite3.Connection, tag: Tag) -> None:
     )
 
 
+def update_predictions(
+    conn: sqlite3.Connection,
+    items: Iterable[Tuple[float, float, str]]
+) -> None:
+    """Batch update predicted coordinates from (pred_x, pred_y, tag_id) tuples."""
+    conn.executemany(
+        "UPDATE tag SET pred_x = ?, pred_y = ? WHERE tag_id = ?",
+        items
+    )
+
+
 def get_tag_by_id(conn: sqlite3.Connection, tag_id: str) -> Optional[Tag]:
     """Fetch a Tag by its ID."""
     row = conn.execute(
@@ -91,27 +146,38 @@ def get_tag_by_id(conn: sqlite3.Connection, tag_id: str) -> Optional[Tag]:
 def list_tags(conn: sqlite3.Connection, tag_type: Optional[str] = None) -> List[Tag]:
     """List all Tags, optionally filtered by type ('ref' or 'tar')."""
     if tag_type in ('ref', 'tar'):
-        rows = conn.execute(
+        rows = _fetch_tuples(
+            conn,
             "SELECT tag_id, type, true_x, true_y, pred_x, pred_y, is_read"
             " FROM tag WHERE type = ?",
             (tag_type,)
-        ).fetchall()
+        )
     else:
-        rows = conn.execute(
+        rows = _fetch_tuples(
+            conn,
             "SELECT tag_id, type, true_x, true_y, pred_x, pred_y, is_read"
             " FROM tag"
-        ).fetchall()
-    return [
-        Tag(
-            tag_id=r["tag_id"],
-            type=r["type"],
-            true_x=r["true_x"],
-            true_y=r["true_y"],
-            pred_x=r["pred_x"],
-            pred_y=r["pred_y"],
-            is_read=bool(r["is_read"])
         )
-        for r in rows
+    return [
+        Tag(tid, tp, tx, ty, px, py, bool(ir))
+        for tid, tp, tx, ty, px, py, ir in rows
+    ]
+
+
+def list_tags_raw(conn: sqlite3.Connection) -> List[dict]:
+    """List all tags as plain dicts, for read-only serialization."""
+    rows = _fetch_tuples(
+        conn,
+        "SELECT tag_id, type, true_x, true_y, pred_x, pred_y, is_read FROM tag"
+    )
+    return [
+        {
+            "tag_id": tid, "type": tp,
+            "true_x": tx, "true_y": ty,
+            "pred_x": px, "pred_y": py,
+            "is_read": bool(ir)
+        }
+        for tid, tp, tx, ty, px, py, ir in rows
     ]
 
 
@@ -119,67 +185,52 @@ def list_tags(conn: sqlite3.Connection, tag_type: Optional[str] = None) -> List[
 
 def insert_record(conn: sqlite3.Connection, record: Record) -> int:
     """Insert a Record and return its generated ID."""
-    cursor = conn.execute(
-        "INSERT INTO record (tag_id, antenna_id, rc, rssi, read_time)"
-        " VALUES (?, ?, ?, ?, ?)",
+    row = conn.execute(
+        INSERT_RECORD_RETURNING_SQL,
         (
             record.tag_id,
             record.antenna_id,
             record.rc,
             record.rssi,
-            record.read_time.isoformat(sep=' ')
+            record.read_time.isoformat(sep=' '),
+            _to_ts(record.read_time)
         )
-    )
-    return cursor.lastrowid
+    ).fetchone()
+    return row[0]
 
 
 def insert_records(conn: sqlite3.Connection, records: List[Record]) -> None:
     """Batch insert multiple Record entries."""
     tuples = [
-        (r.tag_id, r.antenna_id, r.rc, r.rssi, r.read_time.isoformat(sep=' '))
+        (r.tag_id, r.antenna_id, r.rc, r.rssi, r.read_time.isoformat(sep=' '), _to_ts(r.read_time))
         for r in records
     ]
-    conn.executemany(
-        "INSERT INTO record (tag_id, antenna_id, rc, rssi, read_time) VALUES (?, ?, ?, ?, ?)",
-        tuples
-    )
+    conn.executemany(INSERT_RECORD_SQL, tuples)
 
 
 def get_records_by_tag(conn: sqlite3.Connection, tag_id: str) -> List[Record]:
     """Retrieve all Record entries for a given tag."""
-    rows = conn.execute(
+    rows = _fetch_tuples(
+        conn,
         "SELECT record_id, tag_id, antenna_id, rc, rssi, read_time"
         " FROM record WHERE tag_id = ?",
         (tag_id,)
-    ).fetchall()
+    )
     return [
-        Record(
-            tag_id=r["tag_id"],
-            antenna_id=r["antenna_id"],
-            rc=r["rc"],
-            rssi=r["rssi"],
-            read_time=datetime.fromisoformat(r["read_time"]),
-            record_id=r["record_id"]
-        )
-        for r in rows
+        Record(tid, aid, rc, rssi, _parse_read_time(rt), rid)
+        for rid, tid, aid, rc, rssi, rt in rows
     ]
 
 
 def get_records_by_antenna(conn: sqlite3.Connection, antenna_id: str) -> List[Record]:
     """Retrieve all Record entries for a given antenna."""
-    rows = conn.execute(
+    rows = _fetch_tuples(
+        conn,
         "SELECT record_id, tag_id, antenna_id, rc, rssi, read_time"
         " FROM record WHERE antenna_id = ?",
         (antenna_id,)
-    ).fetchall()
+    )
     return [
-        Record(
-            tag_id=r["tag_id"],
-            antenna_id=r["antenna_id"],
-            rc=r["rc"],
-            rssi=r["rssi"],
-            read_time=datetime.fromisoformat(r["read_time"]),
-            record_id=r["record_id"]
-        )
-        for r in rows
+        Record(tid, aid, rc, rssi, _parse_read_time(rt), rid)
+        for rid, tid, aid, rc, rssi, rt in rows
     ]
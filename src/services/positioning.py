@@ -1,55 +1,115 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_absolute_error
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+from joblib import Parallel, delayed
 import warnings
-from ..db import get_connection
+import weakref
+from dataclasses import dataclass
+from typing import List, Optional, Type, Union
+from ..config import RF_USE_ONNX
+from ..db import get_connection, initialize_database
+from ..repository import update_predictions
 from datetime import datetime
 
+try:  # 可选依赖：安装 numba 时使用 JIT 编译的滑动窗口内核
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:  # 可选依赖：安装 skl2onnx + onnxruntime 时用 ONNX Runtime 推理随机森林
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+except ImportError:
+    ort = None
+
+# 支持的森林回归模型
+ForestModel = Union[ExtraTreesRegressor, RandomForestRegressor]
+_FOREST_TYPES = (ExtraTreesRegressor, RandomForestRegressor)
+
+# 已转换模型的 ONNX 推理会话缓存，随模型对象释放
+_onnx_sessions: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
 warnings.filterwarnings('ignore')
 
 
-def load_data_from_db() -> pd.DataFrame:
+@dataclass
+class PositioningDataset:
+    """
+    按 (TagID, read) 排序的基础观测数据，列式（SoA）存储为 numpy 数组。
+    rssi / rc 形状为 (N, 天线数)，缺失读数为 NaN。
+    """
+    tag_ids: np.ndarray      # (N,) object
+    read: np.ndarray         # (N,) int64，Unix 时间戳（微秒）
+    rssi: np.ndarray         # (N, A) float64
+    rc: np.ndarray           # (N, A) float64
+    true_x: np.ndarray       # (N,) float64
+    true_y: np.ndarray       # (N,) float64
+    antenna_ids: List[str]
+
+    def __len__(self) -> int:
+        return len(self.tag_ids)
+
+    def tag_groups(self) -> List[np.ndarray]:
+        """每个标签的行下标（数据按 TagID 排序，组内连续）"""
+        n = len(self)
+        if n == 0:
+            return []
+        starts = np.flatnonzero(np.r_[True, self.tag_ids[1:] != self.tag_ids[:-1]])
+        ends = np.r_[starts[1:], n]
+        return [np.arange(b, e) for b, e in zip(starts, ends)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        转为 DataFrame，列: ['TagID', 'read', 'rssi_antenna...', 'rc_antenna...', 'true_x', 'true_y']
+        """
+        data = {'TagID': self.tag_ids, 'read': self.read}
+        for j, ant in enumerate(self.antenna_ids):
+            data[f'rssi_antenna{ant}'] = self.rssi[:, j]
+        for j, ant in enumerate(self.antenna_ids):
+            data[f'rc_antenna{ant}'] = self.rc[:, j]
+        data['true_x'] = self.true_x
+        data['true_y'] = self.true_y
+        return pd.DataFrame(data)
+
+
+def load_data_from_db() -> PositioningDataset:
     """
-    从 SQLite 数据库读取 record 和 tag 表，构建基础 DataFrame。
-    返回列: ['TagID', 'read', 'rssi_antenna...', 'rc_antenna...', 'true_x', 'true_y']
+    从 SQLite 数据库读取 record 和 tag 表，在 SQL 中按天线透视为宽表，
+    直接装入 numpy 数组（同一时刻同一天线的重复读数取均值）。
     """
     with get_connection() as conn:
-        # 读取 record 表
-        df_records = pd.read_sql_query(
-            "SELECT tag_id AS TagID, antenna_id, rssi, rc, read_time FROM record",
-            conn,
-            parse_dates=["read_time"]
-        )
-        # 读取 tag 表的真实坐标
-        df_tags = pd.read_sql_query(
-            "SELECT tag_id AS TagID, true_x, true_y FROM tag",
-            conn
-        )
-    # 将 rssi 数据 pivot 为宽表
-    df_rssi = df_records.pivot_table(
-        index=["TagID", "read_time"],
-        columns="antenna_id",
-        values="rssi"
-    )
-    df_rssi.columns = [f"rssi_antenna{col}" for col in df_rssi.columns]
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        antenna_ids = [
+            a for (a,) in cursor.execute(
+                "SELECT DISTINCT antenna_id FROM record ORDER BY antenna_id"
+            ).fetchall()
+        ]
+        rssi_cols = ", ".join(["AVG(CASE WHEN r.antenna_id = ? THEN r.rssi END)"] * len(antenna_ids))
+        rc_cols = ", ".join(["AVG(CASE WHEN r.antenna_id = ? THEN r.rc END)"] * len(antenna_ids))
+        rows = cursor.execute(
+            "SELECT r.tag_id, r.read_ts, t.true_x, t.true_y"
+            + (f", {rssi_cols}, {rc_cols}" if antenna_ids else "")
+            + " FROM record r LEFT JOIN tag t ON t.tag_id = r.tag_id"
+            " GROUP BY r.tag_id, r.read_ts ORDER BY r.tag_id, r.read_ts",
+            antenna_ids + antenna_ids
+        ).fetchall()
 
-    # 将 rc 数据 pivot 为宽表
-    df_rc = df_records.pivot_table(
-        index=["TagID", "read_time"],
-        columns="antenna_id",
-        values="rc"
+    num_ant = len(antenna_ids)
+    # 一次性装入对象数组后按列转换类型，NULL 转为 NaN
+    table = np.array(rows, dtype=object).reshape(len(rows), 4 + 2 * num_ant)
+    values = table[:, 2:].astype(np.float64)
+    return PositioningDataset(
+        tag_ids=table[:, 0],
+        read=table[:, 1].astype(np.int64),
+        rssi=values[:, 2:2 + num_ant],
+        rc=values[:, 2 + num_ant:],
+        true_x=values[:, 0],
+        true_y=values[:, 1],
+        antenna_ids=antenna_ids
     )
-    df_rc.columns = [f"rc_antenna{col}" for col in df_rc.columns]
-
-    # 合并 rssi 和 rc
-    df_base = pd.concat([df_rssi, df_rc], axis=1).reset_index()
-    # 重命名 read_time -> read
-    df_base = df_base.rename(columns={"read_time": "read"})
-    # 合并真值坐标
-    dbase = pd.merge(df_base, df_tags, on="TagID", how="left")
-    return dbase
 
 
 def load_reference_tags() -> list:
@@ -64,40 +124,165 @@ def load_reference_tags() -> list:
     return df_ref['TagID'].tolist()
 
 
+_STAT_PREFIXES = ('avg', 'min', 'max', 'stddev')
+
+
+def _window_stats_numpy(arr: np.ndarray, first_window_size: int, window_size: int) -> np.ndarray:
+    n = arr.shape[0]
+    out = np.empty((len(_STAT_PREFIXES),) + arr.shape, dtype=np.float64)
+    # 首窗口：前 first_window_size 行共用首窗口统计量
+    head = min(first_window_size, n)
+    first = arr[:first_window_size]
+    stats0 = np.stack([first.mean(0), first.min(0), first.max(0), first.std(0)])
+    out[:, :head] = stats0[:, None, :]
+    # 后续窗口中长度不足 window_size 的部分（window_size > first_window_size+1 时出现）
+    full_start = max(first_window_size, window_size - 1)
+    for i in range(first_window_size, min(full_start, n)):
+        window = arr[:i + 1]
+        out[:, i] = [window.mean(0), window.min(0), window.max(0), window.std(0)]
+    # 完整窗口：一次性对窗口轴做归约
+    if n > full_start:
+        win = np.lib.stride_tricks.sliding_window_view(arr, window_size, axis=0)
+        win = win[full_start - window_size + 1:]
+        out[0, full_start:] = win.mean(-1)
+        out[1, full_start:] = win.min(-1)
+        out[2, full_start:] = win.max(-1)
+        out[3, full_start:] = win.std(-1)
+    return out
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _window_stats_numba(arr, group_start, group_end, first_window_size, window_size):
+        """
+        一次调用覆盖全部标签：arr 按标签连续排列，group_start/group_end 为每行所属标签的
+        [起, 止) 行号，按行并行，窗口不跨越标签边界。
+        """
+        n, c = arr.shape
+        out = np.empty((4, n, c))
+        for i in prange(n):
+            gs = group_start[i]
+            ge = group_end[i]
+            if i - gs < first_window_size:
+                beg, end = gs, min(gs + first_window_size, ge)
+            else:
+                beg, end = max(gs, i - window_size + 1), i + 1
+            m = end - beg
+            for j in range(c):
+                total = 0.0
+                mn = arr[beg, j]
+                mx = arr[beg, j]
+                for k in range(beg, end):
+                    x = arr[k, j]
+                    total += x
+                    # NaN 与 numpy 一致地向 min/max 传播
+                    if x < mn or x != x:
+                        mn = x
+                    if x > mx or x != x:
+                        mx = x
+                mean = total / m
+                sq = 0.0
+                for k in range(beg, end):
+                    d = arr[k, j] - mean
+                    sq += d * d
+                out[0, i, j] = mean
+                out[1, i, j] = mn
+                out[2, i, j] = mx
+                out[3, i, j] = np.sqrt(sq / m)
+        return out
+
+
+def _window_features(
+    arr: np.ndarray,
+    groups: List[np.ndarray],
+    first_window_size: int,
+    window_size: int
+) -> np.ndarray:
+    """
+    按标签分组计算滑动窗口统计量。
+    arr 形状为 (N, C)，返回 (N, 4*C)，列顺序为 [avg..., min..., max..., stddev...]。
+    """
+    n, c = arr.shape
+    features = np.empty((n, len(_STAT_PREFIXES) * c), dtype=np.float64)
+    if njit is not None and n:
+        # 按标签重排为连续块，整批数据只调用一次 JIT 内核
+        order = np.concatenate(groups)
+        sizes = np.array([len(idx) for idx in groups])
+        ends = np.cumsum(sizes)
+        stats = _window_stats_numba(
+            np.ascontiguousarray(arr[order], dtype=np.float64),
+            np.repeat(ends - sizes, sizes), np.repeat(ends, sizes),
+            first_window_size, window_size
+        )
+        # (4, N, C) -> (N, 4*C)，再按原行号写回
+        features[order] = stats.transpose(1, 0, 2).reshape(len(order), -1)
+    else:
+        def fill(idx: np.ndarray) -> None:
+            stats = _window_stats_numpy(arr[idx], first_window_size, window_size)
+            features[idx] = stats.transpose(1, 0, 2).reshape(len(idx), -1)
+
+        # 各标签互不相关且写入不同行；numpy 归约释放 GIL，用线程并行即可
+        Parallel(n_jobs=-1, prefer="threads")(delayed(fill)(idx) for idx in groups)
+    return np.around(features, 4)
+
+
+def _dataset_window_features(
+    ds: PositioningDataset,
+    first_window_size: int,
+    window_size: int
+) -> pd.DataFrame:
+    """
+    PositioningDataset 的滑动窗口特征：直接在 numpy 数组上计算，最后一次性构建 DataFrame，
+    列布局与 DataFrame 输入相同。
+    """
+    rssi_cols = [f'rssi_antenna{a}' for a in ds.antenna_ids]
+    rc_cols   = [f'rc_antenna{a}'   for a in ds.antenna_ids]
+    base_cols = rssi_cols + rc_cols
+    stat_cols = [f'{prefix}_{c}' for prefix in _STAT_PREFIXES for c in base_cols]
+
+    arr = np.hstack([ds.rssi, ds.rc]).astype(np.float64, copy=False)
+    features = _window_features(arr, ds.tag_groups(), first_window_size, window_size)
+    # 按 (read, TagID) 稳定排序
+    order = np.lexsort((ds.tag_ids, ds.read))
+    out = pd.DataFrame(
+        np.hstack([arr, features])[order].astype(np.float32),
+        columns=base_cols + stat_cols
+    )
+    out['TagID'] = ds.tag_ids[order]
+    out['read'] = ds.read[order]
+    out['true_x'] = ds.true_x[order]
+    out['true_y'] = ds.true_y[order]
+    return out
+
+
 def sliding_window_features(
-    dbase: pd.DataFrame,
+    dbase: Union[PositioningDataset, pd.DataFrame],
     first_window_size: int = 10,
     window_size: int = 10
 ) -> pd.DataFrame:
     """
-    对基础 DataFrame 做滑动窗口特征提取。
+    对基础数据（PositioningDataset 或 DataFrame）做滑动窗口特征提取。
     """
-    newdbase = dbase.iloc[0:0].copy()
-    tags = np.unique(dbase['TagID'].values)
+    if isinstance(dbase, PositioningDataset):
+        return _dataset_window_features(dbase, first_window_size, window_size)
+    groups = list(dbase.groupby('TagID', sort=False).indices.values())
     # 动态获取天线数量
     num_ant = len([c for c in dbase.columns if c.startswith('rssi_antenna')])
     rssi_cols = [f'rssi_antenna{i+1}' for i in range(num_ant)]
     rc_cols   = [f'rc_antenna{i+1}'   for i in range(num_ant)]
+    base_cols = rssi_cols + rc_cols
+    stat_cols = [f'{prefix}_{c}' for prefix in _STAT_PREFIXES for c in base_cols]
 
-    for tag in tags:
-        df_tag = dbase[dbase['TagID']==tag].reset_index(drop=True)
-        n = len(df_tag)
-        # 首窗口
-        window = df_tag.loc[0:first_window_size-1, rssi_cols+rc_cols].values if n>=first_window_size else df_tag.loc[0:n-1, rssi_cols+rc_cols].values
-        stats = {p: np.around(func(window,axis=0),4) for p,func in
-                 [('avg',np.mean), ('min',np.min), ('max',np.max), ('stddev',np.std)]}
-        for i in range(min(first_window_size, n)):
-            for prefix in stats:
-                df_tag.loc[i, [f'{prefix}_{c}' for c in rssi_cols+rc_cols]] = stats[prefix]
-        # 后续窗口
-        for i in range(first_window_size, n):
-            beg = max(0, i-window_size+1)
-            window = df_tag.loc[beg:i, rssi_cols+rc_cols].values
-            stats = {p: np.around(func(window,axis=0),4) for p,func in
-                     [('avg',np.mean), ('min',np.min), ('max',np.max), ('stddev',np.std)]}
-            for prefix in stats:
-                df_tag.loc[i, [f'{prefix}_{c}' for c in rssi_cols+rc_cols]] = stats[prefix]
-        newdbase = pd.concat([newdbase, df_tag], ignore_index=True)
+    arr = dbase[base_cols].to_numpy(dtype=np.float64)
+    features = _window_features(arr, groups, first_window_size, window_size)
+    # 特征列统一为 float32：森林模型内部按 float32 建树，可省去训练/推理时的整表转换
+    newdbase = pd.concat(
+        [
+            dbase.reset_index(drop=True).astype({c: np.float32 for c in base_cols}),
+            pd.DataFrame(features.astype(np.float32), columns=stat_cols)
+        ],
+        axis=1
+    )
 
     # 将关键列移至末尾
     for col in ['TagID', 'read', 'true_x', 'true_y']:
@@ -109,53 +294,106 @@ def sliding_window_features(
     return newdbase
 
 
+def _predict(reg: ForestModel, X: np.ndarray) -> np.ndarray:
+    """
+    模型推理：启用 RF_USE_ONNX 且依赖可用时，将森林模型转换为 ONNX（每个模型只转换一次）
+    并用 ONNX Runtime 推理，否则使用 sklearn 的 predict。
+    """
+    if not RF_USE_ONNX or ort is None or not isinstance(reg, _FOREST_TYPES):
+        return reg.predict(X)
+    sess = _onnx_sessions.get(reg)
+    if sess is None:
+        n_targets = reg.n_outputs_
+        onx = convert_sklearn(
+            reg,
+            initial_types=[("X", FloatTensorType([None, X.shape[1]]))],
+            final_types=[("variable", FloatTensorType([None, n_targets]))]
+        )
+        sess = ort.InferenceSession(
+            onx.SerializeToString(), providers=["CPUExecutionProvider"]
+        )
+        _onnx_sessions[reg] = sess
+    pred = sess.run(None, {"X": np.ascontiguousarray(X, dtype=np.float32)})[0]
+    return pred.reshape(len(X), -1).astype(np.float64)
+
+
+def _feature_matrix(df: pd.DataFrame, num_features: int) -> np.ndarray:
+    """取前 num_features 列为连续的 float32 特征矩阵"""
+    return np.ascontiguousarray(df.iloc[:, :num_features].to_numpy(dtype=np.float32))
+
+
 def train_rf_models(
     feature_df: pd.DataFrame,
     reference_tags: list,
-    num_features: int
-):
+    num_features: int,
+    model_cls: Type[ForestModel] = ExtraTreesRegressor
+) -> ForestModel:
     """
-    训练 X、Y 方向的随机森林回归模型。
+    训练同时预测 X、Y 坐标的多输出森林回归模型。
+    默认使用训练更快的 ExtraTrees，可通过 model_cls 指定 RandomForestRegressor。
     """
     landmarc = feature_df[feature_df['TagID'].isin(reference_tags)]
-    X = landmarc.iloc[:, :num_features].values
-    yx = landmarc['true_x'].values
-    yy = landmarc['true_y'].values
+    X = _feature_matrix(landmarc, num_features)
+    y = np.column_stack([landmarc['true_x'].values, landmarc['true_y'].values])
 
-    regX = RandomForestRegressor(n_estimators=1000, random_state=0)
-    regY = RandomForestRegressor(n_estimators=1000, random_state=0)
-    regX.fit(X, yx)
-    regY.fit(X, yy)
-    return regX, regY
+    reg = model_cls(n_estimators=1000, n_jobs=-1, random_state=0)
+    reg.fit(X, y)
+    return reg
 
 
 def evaluate_position(
     feature_df: pd.DataFrame,
-    regX: RandomForestRegressor,
-    regY: RandomForestRegressor,
-    num_features: int
+    reg: ForestModel,
+    num_features: int,
+    reference_tags: Optional[list] = None
 ) -> pd.DataFrame:
     """
     对所有标签进行位置预测并计算 MAE。
+    给定 reference_tags 时，参考标签直接以真实坐标作为预测值（MAE 为 0），只对其余标签做推理。
+    """
+    true_xy = np.column_stack([feature_df['true_x'].values, feature_df['true_y'].values])
+    pred = true_xy.copy()
+    if reference_tags is None:
+        infer = np.ones(len(feature_df), dtype=bool)
+    else:
+        infer = ~feature_df['TagID'].isin(reference_tags).values
+    if infer.any():
+        pred[infer] = _predict(reg, _feature_matrix(feature_df[infer], num_features))
+    errors = pd.DataFrame({
+        'TagID': feature_df['TagID'].values,
+        'MAE_x': np.abs(true_xy[:, 0] - pred[:, 0]),
+        'MAE_y': np.abs(true_xy[:, 1] - pred[:, 1]),
+    })
+    results = errors.groupby('TagID').mean().reset_index()
+    results['MAE_avg'] = (results['MAE_x'] + results['MAE_y']) / 2
+    return results.round({'MAE_x': 4, 'MAE_y': 4, 'MAE_avg': 4})
+
+
+def persist_predictions(
+    feature_df: pd.DataFrame,
+    reg: ForestModel,
+    reference_tags: list,
+    num_features: int
+) -> pd.DataFrame:
     """
-    tags = np.unique(feature_df['TagID'].values)
-    records = []
-    for tag in tags:
-        df_tag = feature_df[feature_df['TagID']==tag]
-        Xtest = df_tag.iloc[:, :num_features].values
-        yx_true = df_tag['true_x'].values
-        yy_true = df_tag['true_y'].values
-        yx_pred = regX.predict(Xtest)
-        yy_pred = regY.predict(Xtest)
-        mae_x = mean_absolute_error(yx_true, yx_pred)
-        mae_y = mean_absolute_error(yy_true, yy_pred)
-        records.append({
-            'TagID': tag,
-            'MAE_x': round(mae_x,4),
-            'MAE_y': round(mae_y,4),
-            'MAE_avg': round((mae_x+mae_y)/2,4)
-        })
-    return pd.DataFrame(records)
+    预测所有目标标签（非参考标签）的坐标，按标签取各窗口预测均值，
+    并一次性批量写回 tag 表的 pred_x / pred_y。
+    """
+    targets = feature_df[~feature_df['TagID'].isin(reference_tags)]
+    if targets.empty:
+        return pd.DataFrame(columns=['TagID', 'pred_x', 'pred_y'])
+    pred = _predict(reg, _feature_matrix(targets, num_features))
+    preds = (
+        pd.DataFrame({'TagID': targets['TagID'].values, 'pred_x': pred[:, 0], 'pred_y': pred[:, 1]})
+        .groupby('TagID').mean()
+        .reset_index()
+    )
+    items = list(zip(
+        preds['pred_x'].tolist(), preds['pred_y'].tolist(), preds['TagID'].tolist()
+    ))
+    with get_connection() as conn:
+        update_predictions(conn, items)
+    return preds
 
 
 if __name__ == '__main__':
@@ -164,6 +402,8 @@ if __name__ == '__main__':
     WINDOW_SIZE = 10
     NUM_FEATURES = 40  # 前 num_features 列作为特征
 
+    # 0. 确保数据库结构存在
+    initialize_database()
     # 1. 从数据库加载原始观测数据
     raw = load_data_from_db()
     # 2. 从数据库获取参考标签列表
@@ -171,7 +411,9 @@ if __name__ == '__main__':
     # 3. 滑动窗口特征提取
     feats = sliding_window_features(raw, FIRST_WINDOW, WINDOW_SIZE)
     # 4. 训练模型
-    regX, regY = train_rf_models(feats, REFERENCE_TAGS, NUM_FEATURES)
+    reg = train_rf_models(feats, REFERENCE_TAGS, NUM_FEATURES)
     # 5. 评估所有标签
-    results = evaluate_position(feats, regX, regY, NUM_FEATURES)
+    results = evaluate_position(feats, reg, NUM_FEATURES, REFERENCE_TAGS)
     print(results.to_string(index=False))
+    # 6. 写回目标标签预测坐标
+    persist_predictions(feats, reg, REFERENCE_TAGS, NUM_FEATURES)
@@ -1,10 +1,13 @@
 import os
 import asyncio
-import json
-import requests
+import time
+from functools import lru_cache
+import orjson
+import httpx
 import websockets
-from typing import List, AsyncGenerator
+from typing import List, AsyncGenerator, Optional
 from ..models import Record
+from ..repository import insert_records
 from datetime import datetime
 
 
@@ -19,77 +22,94 @@ class TagSeeClient:
         # 基础 REST 接口和 WebSocket URL
         self.base_url = f"http://{self.host}:{self.port}/service"
         self.ws_url = f"ws://{self.host}:{self.port}/socket"
+        # 异步 HTTP 客户端，首次调用时创建，复用 keep-alive 连接
+        self._client: Optional[httpx.AsyncClient] = None
 
-    def discover_agents(self) -> List[dict]:
+    @property
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=16)
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """关闭底层 HTTP 连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def discover_agents(self) -> List[dict]:
         """
         GET /service/discover
         返回: { errorCode:0, agents:[{ip,name,remark}, ...] }
         """
-        resp = requests.get(f"{self.base_url}/discover")
+        resp = await self._http.get("/discover")
         resp.raise_for_status()
         data = resp.json()
         if data.get("errorCode") != 0:
             raise RuntimeError(f"发现 Agent 失败: {data}")
         return data.get("agents", [])
 
-    def create_agent(self, ip: str, name: str, remark: str = "") -> None:
+    async def create_agent(self, ip: str, name: str, remark: str = "") -> None:
         """
         POST /service/agent/create
         参数: ip, name, remark
         返回: { errorCode:0 }
         """
         payload = {"ip": ip, "name": name, "remark": remark}
-        resp = requests.post(f"{self.base_url}/agent/create", json=payload)
+        resp = await self._http.post("/agent/create", json=payload)
         resp.raise_for_status()
         data = resp.json()
         if data.get("errorCode") != 0:
             raise RuntimeError(f"创建 Agent 失败: {data}")
 
-    def update_agent(self, ip: str, name: str, remark: str = "") -> None:
+    async def update_agent(self, ip: str, name: str, remark: str = "") -> None:
         """
         POST /service/agent/:ip/update
         参数: ip, name, remark
         返回: { errorCode:0 }
         """
         payload = {"ip": ip, "name": name, "remark": remark}
-        resp = requests.post(f"{self.base_url}/agent/{ip}/update", json=payload)
+        resp = await self._http.post(f"/agent/{ip}/update", json=payload)
         resp.raise_for_status()
         data = resp.json()
         if data.get("errorCode") != 0:
             raise RuntimeError(f"更新 Agent 失败: {data}")
 
-    def remove_agent(self, ip: str) -> None:
+    async def remove_agent(self, ip: str) -> None:
         """
         POST /service/agent/:ip/remove
         参数: ip
         返回: { errorCode:0 }
         """
         payload = {"ip": ip}
-        resp = requests.post(f"{self.base_url}/agent/{ip}/remove", json=payload)
+        resp = await self._http.post(f"/agent/{ip}/remove", json=payload)
         resp.raise_for_status()
         data = resp.json()
         if data.get("errorCode") != 0:
             raise RuntimeError(f"移除 Agent 失败: {data}")
 
-    def start_reading(self, ip: str) -> None:
+    async def start_reading(self, ip: str) -> None:
         """
         GET /service/agent/:ip/start
         启动读取
         返回: { errorCode:0 }
         """
-        resp = requests.get(f"{self.base_url}/agent/{ip}/start")
+        resp = await self._http.get(f"/agent/{ip}/start")
         resp.raise_for_status()
         data = resp.json()
         if data.get("errorCode") != 0:
             raise RuntimeError(f"启动读取失败: {data}")
 
-    def stop_reading(self, ip: str) -> None:
+    async def stop_reading(self, ip: str) -> None:
         """
         GET /service/agent/:ip/stop
         停止读取
         返回: { errorCode:0 }
         """
-        resp = requests.get(f"{self.base_url}/agent/{ip}/stop")
+        resp = await self._http.get(f"/agent/{ip}/stop")
         resp.raise_for_status()
         data = resp.json()
         if data.get("errorCode") != 0:
@@ -105,46 +125,117 @@ class TagSeeClient:
         """
         async with websockets.connect(self.ws_url) as ws:
             async for raw in ws:
-                msg = json.loads(raw)
+                msg = orjson.loads(raw)
                 # 跳过心跳或错误消息
                 if msg.get("errorCode") != 0 or msg.get("type") != "reading":
                     continue
-                tags = msg.get("tags", [])
-                recs: List[Record] = []
-                for t in tags:
-                    # 提取字段
-                    epc = t.get("epc")
-                    ant = t.get("antenna")
-                    rssi = t.get("rssi")
-                    # 优先使用 lastSeenTime, 其次 firstSeenTime, 再 timestamp
-                    time_str = t.get("lastSeenTime") or t.get("firstSeenTime") or t.get("timestamp")
-                    dt = datetime.fromisoformat(time_str) if time_str else datetime.now()
-                    recs.append(Record(
-                        tag_id=str(epc),
-                        antenna_id=str(ant),
-                        rc=1,
-                        rssi=float(rssi) if rssi is not None else 0.0,
-                        read_time=dt
-                    ))
-                yield recs
-
-
-async def collect_and_store_records(ip: str, conn) -> None:
+                yield [_tag_to_record(t) for t in msg.get("tags", [])]
+
+
+@lru_cache(maxsize=4096)
+def _parse_time_str(time_str: str) -> datetime:
+    # 同一帧内大量标签通常共用同一时间字符串
+    return datetime.fromisoformat(time_str)
+
+
+def _parse_time(value) -> datetime:
+    if not value:
+        return datetime.now()
+    # 数值时间戳按 epoch 毫秒处理
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000.0)
+    return _parse_time_str(value)
+
+
+def _tag_to_record(t: dict) -> Record:
+    """将单条 WebSocket 标签读数转换为 Record"""
+    t_get = t.get
+    rssi = t_get("rssi")
+    # 优先使用 lastSeenTime, 其次 firstSeenTime, 再 timestamp
+    return Record(
+        tag_id=str(t_get("epc")),
+        antenna_id=str(t_get("antenna")),
+        rc=1,
+        rssi=float(rssi) if rssi is not None else 0.0,
+        read_time=_parse_time(
+            t_get("lastSeenTime") or t_get("firstSeenTime") or t_get("timestamp")
+        )
+    )
+
+
+async def collect_and_store_records(
+    ip: str,
+    conn,
+    flush_size: int = 500,
+    flush_interval: float = 0.2,
+    duration: Optional[float] = None
+) -> None:
     """
-    示例: 启动读取，收集一次批量读数写入数据库，然后停止读取
+    启动读取，持续收集读数并批量写入数据库，结束后停止读取。
+    多个 WebSocket 帧先缓冲，累计 flush_size 条或缓冲数据等待超过 flush_interval 秒时
+    用一次 executemany 写入并提交；两个时限由定时器保证，读写器只发心跳时同样生效。
+    duration 为 None 时一直采集到数据流结束。
+    写入失败时回滚并丢弃该批缓冲，停止读取后重新抛出异常。
     """
     client = TagSeeClient()
-    # 启动读取
-    client.start_reading(ip)
+    buf: List[Record] = []
+
+    def flush() -> None:
+        if not buf:
+            return
+        try:
+            insert_records(conn, buf)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            buf.clear()
+
     try:
-        # 异步等待一批次数据
-        async for batch in client.readings_stream():
-            from ..repository import insert_records
-            insert_records(conn, batch)
-            break
+        # 启动读取
+        await client.start_reading(ip)
+        try:
+            stream = client.readings_stream()
+            # 等待中的下一帧；用 asyncio.wait 限时等待，超时不会取消读取
+            pending: Optional[asyncio.Future] = None
+            start = last_flush = time.monotonic()
+            try:
+                while True:
+                    deadlines = []
+                    if buf:
+                        deadlines.append(last_flush + flush_interval)
+                    if duration is not None:
+                        deadlines.append(start + duration)
+                    timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                    if pending is None:
+                        pending = asyncio.ensure_future(stream.__anext__())
+                    done, _ = await asyncio.wait({pending}, timeout=timeout)
+                    if done:
+                        task, pending = pending, None
+                        try:
+                            buf.extend(task.result())
+                        except StopAsyncIteration:
+                            break
+                    now = time.monotonic()
+                    if len(buf) >= flush_size or (buf and now - last_flush >= flush_interval):
+                        flush()
+                        last_flush = now
+                    elif not buf:
+                        last_flush = now
+                    if duration is not None and now - start >= duration:
+                        break
+            finally:
+                if pending is not None:
+                    pending.cancel()
+                    await asyncio.gather(pending, return_exceptions=True)
+                await stream.aclose()
+                # 写入剩余缓冲
+                flush()
+        finally:
+            await client.stop_reading(ip)
     finally:
-        # 停止读取
-        client.stop_reading(ip)
+        await client.aclose()
 
-# 若在同步上下文中使用，可调用 asyncio.run():
-# asyncio.run(collect_and_store_records("192.168.1.100", conn))
\ No newline at end of file
+# 若在同步上下文中使用，可调用 asyncio.run()，例如采集 10 秒:
+# asyncio.run(collect_and_store_records("192.168.1.100", conn, duration=10))
\ No newline at end of file
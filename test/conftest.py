@@ -0,0 +1,38 @@
+import pytest
+
+import src.db as db_module
+
+
+@pytest.fixture(scope="session")
+def session_db():
+    # 整个测试会话共用一个共享缓存的内存数据库，表结构只创建一次，无磁盘 I/O
+    test_db = "file:rfid_ips_test?mode=memory&cache=shared"
+    token = db_module.db_path.set(test_db)
+    db_module.fast_test_mode()
+    db_module.initialize_database()
+    yield test_db
+    db_module.close_pool()
+    db_module.db_path.reset(token)
+
+
+@pytest.fixture
+def clean_db(session_db):
+    # 每个测试开始前清空数据，代替逐个测试重建数据库
+    token = db_module.db_path.set(session_db)
+    with db_module.get_connection() as conn:
+        conn.execute("DELETE FROM record")
+        conn.execute("DELETE FROM tag")
+        conn.execute("DELETE FROM antenna")
+    yield session_db
+    db_module.db_path.reset(token)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warmup():
+    # 会话开始时预先导入重量级模块，并触发一次 numba 内核编译，避免计入首个测试耗时
+    import numpy as np
+    import pandas  # noqa: F401
+    import sklearn.ensemble  # noqa: F401
+    from src.services import positioning
+    if positioning.njit is not None:
+        positioning._window_features(np.zeros((2, 2)), [np.arange(2)], 1, 1)
@@ -4,14 +4,13 @@ from pathlib import Path
 
 import src.db as db_module
 from src.api import app
+from src.models import Record
+from src.repository import insert_records
 
 
 @pytest.fixture(autouse=True)
-def client(tmp_path):
-    # 使用文件数据库，避免使用内存数据库
-    test_db = tmp_path / "test.db"
-    db_module.DB_PATH = str(test_db)
-    db_module.initialize_database()
+def client(clean_db):
+    # 使用会话级内存数据库（见 conftest.py），每个测试前清空
     client = TestClient(app)
     yield client
 
@@ -64,4 +63,82 @@ def test_export_tags(client):
     assert r.status_code == 200
     assert "text/csv" in r.headers["content-type"]
     text = r.text
-    assert "T3" in text
+    lines = text.splitlines()
+    assert lines[0] == "tag_id,type,true_x,true_y,pred_x,pred_y,is_read"
+    assert lines[1] == "T3,tar,5.0,6.0,,,0"
+
+
+def test_upload_endpoints(client):
+    # CSV 批量导入天线
+    ant_csv = "antenna_id,x,y\nA1,1.0,2.0\nA2,3.0,4.0\n"
+    r = client.post("/api/antennas/upload", files={"file": ("ants.csv", ant_csv, "text/csv")})
+    assert r.status_code == 200
+    assert len(client.get("/api/antennas/").json()) == 2
+    # CSV 批量导入标签，目标标签坐标可为空
+    tag_csv = "tag_id,type,true_x,true_y\nT1,ref,0.0,0.0\nT2,tar,,\n"
+    r = client.post("/api/tags/upload", files={"file": ("tags.csv", tag_csv, "text/csv")})
+    assert r.status_code == 200
+    data = {t["tag_id"]: t for t in client.get("/api/tags/").json()}
+    assert data["T1"]["type"] == "ref" and data["T1"]["true_x"] == 0.0
+    assert data["T2"]["true_x"] is None and data["T2"]["is_read"] is False
+
+
+def test_readings_endpoint(client):
+    # 非法类型
+    assert client.get("/api/readings/", params={"tag_type": "bad"}).status_code == 400
+    client.post("/api/antennas/", json={"antenna_id":"A1","x":1.0,"y":2.0})
+    client.post("/api/tags/", json={"tag_id":"T1","type":"ref","true_x":0.0,"true_y":0.0})
+    client.post("/api/tags/", json={"tag_id":"T2","type":"ref","true_x":1.0,"true_y":1.0})
+    with db_module.get_connection() as conn:
+        insert_records(conn, [
+            Record(tag_id="T1", antenna_id="A1", rc=1, rssi=-50.0),
+            Record(tag_id="T1", antenna_id="A1", rc=2, rssi=-51.0),
+        ])
+    r = client.get("/api/readings/", params={"tag_type": "ref"})
+    assert r.status_code == 200
+    assert r.json() == [
+        {"tag_id":"T1","rssi":[-50.0,-51.0],"rc":[1,2],"is_read":False},
+        {"tag_id":"T2","rssi":[],"rc":[],"is_read":False},
+    ]
+
+
+def test_readings_rssi_full_precision(client):
+    # 任意 float RSSI 经 SQL 聚合后不丢失精度
+    client.post("/api/antennas/", json={"antenna_id":"A1","x":1.0,"y":2.0})
+    client.post("/api/tags/", json={"tag_id":"T1","type":"tar"})
+    values = [0.30000000000000004, -55.123456789012344, -50.0]
+    with db_module.get_connection() as conn:
+        insert_records(conn, [
+            Record(tag_id="T1", antenna_id="A1", rc=1, rssi=v) for v in values
+        ])
+    r = client.get("/api/readings/", params={"tag_type": "tar"})
+    assert r.json()[0]["rssi"] == values
+
+
+def test_upload_tags_rejects_invalid_type(client):
+    # 任一行类型非法时整批回滚
+    tag_csv = "tag_id,type,true_x,true_y\nT1,ref,0.0,0.0\nT2,bad,1.0,1.0\n"
+    r = client.post("/api/tags/upload", files={"file": ("tags.csv", tag_csv, "text/csv")})
+    assert r.status_code == 400
+    assert client.get("/api/tags/").json() == []
+
+
+def test_upload_tags_bom_and_short_rows(client):
+    # Excel 导出的 UTF-8 BOM 表头；行尾缺失的单元格按空值处理
+    tag_csv = "\ufefftag_id,type,true_x,true_y\nT1,ref\nT2,tar,1.5\n".encode("utf-8")
+    r = client.post("/api/tags/upload", files={"file": ("tags.csv", tag_csv, "text/csv")})
+    assert r.status_code == 200
+    tags = {t["tag_id"]: t for t in client.get("/api/tags/").json()}
+    assert tags["T1"]["true_x"] is None and tags["T1"]["true_y"] is None
+    assert tags["T2"]["true_x"] == 1.5 and tags["T2"]["true_y"] is None
+
+
+def test_upload_rejects_bad_header_and_rows(client):
+    # 缺少必需列或必需单元格为空时返回 400，而不是 500
+    r = client.post("/api/tags/upload", files={"file": ("tags.csv", "id,type\nT1,ref\n", "text/csv")})
+    assert r.status_code == 400
+    r = client.post("/api/antennas/upload", files={"file": ("ants.csv", "antenna_id,x\nA1,0\n", "text/csv")})
+    assert r.status_code == 400
+    r = client.post("/api/antennas/upload", files={"file": ("ants.csv", "antenna_id,x,y\nA1,0\n", "text/csv")})
+    assert r.status_code == 400
+    assert client.get("/api/antennas/").json() == []
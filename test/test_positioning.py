@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -9,41 +10,42 @@ from src.services.positioning import (
     sliding_window_features,
     train_rf_models,
     evaluate_position,
+    persist_predictions,
     load_reference_tags
 )
-from src.repository import insert_antenna, insert_tag, insert_record
+from src.repository import insert_antennas, insert_tags, insert_records, get_tag_by_id
+from sklearn.ensemble import ExtraTreesRegressor
 from src.models import Antenna, Tag, Record
 from src.db import get_connection
 
 @ pytest.fixture(autouse=True)
-def init_db(tmp_path):
-    # 使用文件数据库，避免使用内存数据库
-    test_db = tmp_path / "test_positioning.db"
-    db_module.DB_PATH = str(test_db)
-    db_module.initialize_database()
-    # 插入测试数据：2天线，2标签，每标签3次读数
+def init_db(clean_db):
+    # 使用会话级内存数据库（见 conftest.py），每个测试前清空
+    # 插入测试数据：2天线，2标签，每标签3次读数（同一事务内批量写入）
+    base_time = datetime(2025, 5, 1, 0, 0, 0)
+    readings = [("T1", "1", -50.0), ("T1", "2", -60.0), ("T2", "1", -55.0), ("T2", "2", -65.0)]
     with get_connection() as conn:
         # 天线
-        insert_antenna(conn, Antenna(antenna_id="1", x=0.0, y=0.0))
-        insert_antenna(conn, Antenna(antenna_id="2", x=1.0, y=1.0))
+        insert_antennas(conn, [
+            Antenna(antenna_id="1", x=0.0, y=0.0),
+            Antenna(antenna_id="2", x=1.0, y=1.0),
+        ])
         # 标签：T1为ref, T2为tar
-        insert_tag(conn, Tag(tag_id="T1", type="ref", true_x=0.0, true_y=0.0))
-        insert_tag(conn, Tag(tag_id="T2", type="tar", true_x=2.0, true_y=2.0))
-        # 插入3个时间点
-        base_time = datetime(2025, 5, 1, 0, 0, 0)
-        for i in range(3):
-            t = base_time + timedelta(seconds=i)
-            # T1
-            insert_record(conn, Record(tag_id="T1", antenna_id="1", rc=1, rssi=-50.0, read_time=t))
-            insert_record(conn, Record(tag_id="T1", antenna_id="2", rc=1, rssi=-60.0, read_time=t))
-            # T2
-            insert_record(conn, Record(tag_id="T2", antenna_id="1", rc=1, rssi=-55.0, read_time=t))
-            insert_record(conn, Record(tag_id="T2", antenna_id="2", rc=1, rssi=-65.0, read_time=t))
+        insert_tags(conn, [
+            Tag(tag_id="T1", type="ref", true_x=0.0, true_y=0.0),
+            Tag(tag_id="T2", type="tar", true_x=2.0, true_y=2.0),
+        ])
+        # 3个时间点 × 2标签 × 2天线
+        insert_records(conn, [
+            Record(tag_id=tag, antenna_id=ant, rc=1, rssi=rssi, read_time=base_time + timedelta(seconds=i))
+            for i in range(3)
+            for tag, ant, rssi in readings
+        ])
     yield
 
 
 def test_load_data_from_db():
-    df = load_data_from_db()
+    df = load_data_from_db().to_dataframe()
     # 检查列
     expected_cols = {
         'TagID', 'read',
@@ -65,20 +67,20 @@ def test_sliding_and_models():
     num_base = 4
     num_stats = 4
     # 检查部分统计特征列存在
-    assert 'avg_rssi_antenna1' in feats.columns
-    assert 'min_rc_antenna2' in feats.columns
-    assert 'stddev_rssi_antenna2' in feats.columns
+    cols = set(feats.columns)
+    assert {'avg_rssi_antenna1', 'min_rc_antenna2', 'stddev_rssi_antenna2'} <= cols
     # 样本行数仍为6
     assert feats.shape[0] == 6
     # 参考标签列表
     refs = load_reference_tags()
     assert refs == ['T1']
     # 训练模型，共使用16个特征
-    regX, regY = train_rf_models(feats, refs, num_features=num_base*num_stats)
-    # 模型应已训练
-    assert hasattr(regX, 'predict') and hasattr(regY, 'predict')
+    reg = train_rf_models(feats, refs, num_features=num_base*num_stats)
+    # 模型应已训练，默认使用 ExtraTrees
+    assert hasattr(reg, 'predict')
+    assert isinstance(reg, ExtraTreesRegressor)
     # 评估
-    results = evaluate_position(feats, regX, regY, num_features=num_base*num_stats)
+    results = evaluate_position(feats, reg, num_features=num_base*num_stats)
     # 验证结果行数和列
     assert set(results['TagID']) == {'T1','T2'}
     assert set(['MAE_x','MAE_y','MAE_avg']).issubset(results.columns)
@@ -86,3 +88,85 @@ def test_sliding_and_models():
     ref_row = results[results.TagID=='T1'].iloc[0]
     assert pytest.approx(ref_row.MAE_x, abs=1e-6) == 0
     assert pytest.approx(ref_row.MAE_y, abs=1e-6) == 0
+    # 传入参考标签时跳过其推理，误差严格为0，目标标签结果不变
+    short = evaluate_position(feats, reg, num_features=num_base*num_stats, reference_tags=refs)
+    short_ref = short[short.TagID=='T1'].iloc[0]
+    assert short_ref.MAE_x == 0 and short_ref.MAE_y == 0
+    pd.testing.assert_frame_equal(
+        short[short.TagID=='T2'].reset_index(drop=True),
+        results[results.TagID=='T2'].reset_index(drop=True)
+    )
+    # 写回目标标签预测坐标，参考标签保持为空
+    preds = persist_predictions(feats, reg, refs, num_features=num_base*num_stats)
+    assert list(preds['TagID']) == ['T2']
+    with get_connection() as conn:
+        t2 = get_tag_by_id(conn, 'T2')
+        t1 = get_tag_by_id(conn, 'T1')
+    assert t2.pred_x == pytest.approx(preds['pred_x'].iloc[0])
+    assert t2.pred_y == pytest.approx(preds['pred_y'].iloc[0])
+    assert t1.pred_x is None and t1.pred_y is None
+
+
+def test_window_stats_numba_matches_numpy():
+    from src.services import positioning
+    if positioning.njit is None:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(0)
+    arr = rng.normal(-55.0, 5.0, size=(25, 4))
+    arr[7, 1] = np.nan
+    # 覆盖首窗口、不足 window_size 的窗口和完整窗口
+    for first, size in [(2, 2), (3, 6), (10, 4), (30, 5)]:
+        expected = positioning._window_stats_numpy(arr, first, size)
+        start = np.zeros(len(arr), dtype=np.int64)
+        end = np.full(len(arr), len(arr), dtype=np.int64)
+        actual = positioning._window_stats_numba(arr, start, end, first, size)
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+
+
+def test_window_features_groups_numba_matches_numpy(monkeypatch):
+    from src.services import positioning
+    if positioning.njit is None:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(1)
+    arr = rng.normal(-55.0, 5.0, size=(40, 3))
+    # 标签行交错且长度不一，窗口不得跨越标签边界
+    labels = rng.integers(0, 4, size=len(arr))
+    groups = [np.flatnonzero(labels == k) for k in range(4)]
+    actual = positioning._window_features(arr, groups, 3, 5)
+    monkeypatch.setattr(positioning, "njit", None)
+    expected = positioning._window_features(arr, groups, 3, 5)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+
+
+def test_predict_onnx_matches_sklearn(monkeypatch):
+    from src.services import positioning
+    if positioning.ort is None:
+        pytest.skip("skl2onnx/onnxruntime not installed")
+    from sklearn.ensemble import RandomForestRegressor
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(50, 4))
+    y = rng.normal(size=(50, 2))
+    reg = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y)
+    monkeypatch.setattr(positioning, "RF_USE_ONNX", True)
+    # ONNX 以 float32 推理，允许单精度误差
+    np.testing.assert_allclose(positioning._predict(reg, X), reg.predict(X), atol=1e-4)
+
+
+def test_sliding_dataset_path_skips_dataframe(monkeypatch):
+    # PositioningDataset 直接在 numpy 上计算，不经 to_dataframe；列名取自天线 ID
+    from src.services.positioning import PositioningDataset
+    def fail(self):
+        raise AssertionError("to_dataframe should not be called")
+    monkeypatch.setattr(PositioningDataset, "to_dataframe", fail)
+    ds = PositioningDataset(
+        tag_ids=np.array(["T1", "T1", "T2"], dtype=object),
+        read=np.array([0, 1, 0], dtype=np.int64),
+        rssi=np.array([[-50.0, -60.0], [-52.0, -62.0], [-55.0, -65.0]]),
+        rc=np.ones((3, 2)),
+        true_x=np.zeros(3), true_y=np.zeros(3),
+        antenna_ids=["A", "B"]
+    )
+    feats = sliding_window_features(ds, first_window_size=2, window_size=2)
+    assert list(feats['TagID']) == ['T1', 'T2', 'T1']
+    assert list(feats['avg_rssi_antennaA']) == [-51.0, -55.0, -51.0]
+    assert feats['stddev_rc_antennaB'].dtype == np.float32
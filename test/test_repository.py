@@ -1,22 +1,21 @@
 import pytest
+import sqlite3
+import time
 from pathlib import Path
+from datetime import datetime, timedelta, timezone
 
 import src.db as db_module
 from src.repository import (
     insert_antenna, list_antennas,
     insert_tag, list_tags, get_tag_by_id, update_tag,
-    insert_record, get_records_by_tag
+    insert_record, get_records_by_tag, _to_ts
 )
 from src.models import Antenna, Tag, Record
 
 
 @pytest.fixture(autouse=True)
-def init_db(tmp_path):
-    # 使用文件数据库，避免使用内存数据库
-    test_db = tmp_path / "test.db"
-    # 覆盖 db_module 的 DB_PATH 并重新初始化
-    db_module.DB_PATH = str(test_db)
-    db_module.initialize_database()
+def init_db(clean_db):
+    # 使用会话级内存数据库（见 conftest.py），每个测试前清空
     yield
 
 
@@ -67,7 +66,123 @@ def test_record_crud():
         recs = get_records_by_tag(conn, "T2")
         assert len(recs) == 1
         r = recs[0]
+        assert r.record_id == rec_id
         assert r.tag_id == "T2"
         assert r.antenna_id == "A1"
         assert r.rc == 5
         assert r.rssi == -60.5
+        assert r.read_time == record.read_time
+
+
+def test_connection_rollback_on_error():
+    # 异常退出时回滚，连接归还连接池后不残留未提交数据
+    with pytest.raises(RuntimeError):
+        with db_module.get_connection() as conn:
+            insert_antenna(conn, Antenna(antenna_id="A1", x=0.0, y=0.0))
+            raise RuntimeError("boom")
+    with db_module.get_connection() as conn:
+        assert list_antennas(conn) == []
+
+
+def test_initialize_database_runs_once_per_path(monkeypatch):
+    # 同一路径已初始化时不再重复执行建表脚本
+    assert db_module.db_path.get() in db_module._initialized
+    def fail_connect(*args, **kwargs):
+        raise AssertionError("schema should not be re-run")
+    monkeypatch.setattr(db_module.sqlite3, "connect", fail_connect)
+    db_module.initialize_database()
+
+
+def test_db_path_context_isolation():
+    # 在独立上下文中切换数据库路径，不影响当前上下文使用的会话数据库
+    import contextvars
+
+    def use_other_db():
+        db_module.db_path.set("file:rfid_ips_other?mode=memory&cache=shared")
+        db_module.initialize_database()
+        with db_module.get_connection() as conn:
+            insert_antenna(conn, Antenna(antenna_id="B1", x=0.0, y=0.0))
+            return [a.antenna_id for a in list_antennas(conn)]
+
+    # 数据库路径只能通过 db_path 切换，不再有可被误赋值的 DB_PATH 模块属性
+    assert not hasattr(db_module, "DB_PATH")
+    assert contextvars.copy_context().run(use_other_db) == ["B1"]
+    with db_module.get_connection() as conn:
+        assert list_antennas(conn) == []
+
+
+def test_record_read_time_keeps_utc_offset():
+    # 带时区偏移的时间原样读回；无偏移的时间读回为本地 naive 时间
+    with db_module.get_connection() as conn:
+        insert_antenna(conn, Antenna(antenna_id="A1", x=0.0, y=0.0))
+        insert_tag(conn, Tag(tag_id="T1", type="tar"))
+        aware = datetime(2025, 5, 1, 12, 0, 0, 123456, tzinfo=timezone(timedelta(hours=8)))
+        naive = datetime(2025, 5, 1, 12, 0, 0, 654321)
+        insert_record(conn, Record(tag_id="T1", antenna_id="A1", rc=1, rssi=-50.0, read_time=aware))
+        insert_record(conn, Record(tag_id="T1", antenna_id="A1", rc=1, rssi=-51.0, read_time=naive))
+        times = [r.read_time for r in get_records_by_tag(conn, "T1")]
+    assert times[0] == aware and times[0].utcoffset() == timedelta(hours=8)
+    assert times[1] == naive and times[1].tzinfo is None
+
+
+def test_migrate_backfills_read_ts_exactly(tmp_path, monkeypatch):
+    # 旧库迁移：非 UTC 主机上 naive 时间按本地时间换算，带偏移的时间不再二次换算，保留微秒
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    try:
+        path = str(tmp_path / "old.db")
+        old_schema = "\n".join(
+            line for line in db_module._SCHEMA.splitlines() if "read_ts" not in line
+        )
+        naive = datetime(2025, 5, 1, 12, 0, 0, 123456)
+        aware = datetime(2025, 5, 1, 12, 0, 0, 654321, tzinfo=timezone(timedelta(hours=-5)))
+        conn = sqlite3.connect(path)
+        conn.executescript(old_schema)
+        conn.execute("INSERT INTO antenna VALUES ('A1', 0, 0)")
+        conn.execute("INSERT INTO tag (tag_id, type) VALUES ('T1', 'tar')")
+        conn.executemany(
+            "INSERT INTO record (tag_id, antenna_id, rc, rssi, read_time) VALUES ('T1', 'A1', 1, -50, ?)",
+            [(naive.isoformat(sep=' '),), (aware.isoformat(sep=' '),)]
+        )
+        conn.commit()
+        conn.close()
+
+        token = db_module.db_path.set(path)
+        try:
+            db_module.initialize_database()
+            with db_module.get_connection() as conn:
+                # 迁移后的表经触发器补齐 read_ts
+                conn.execute(
+                    "INSERT INTO record (tag_id, antenna_id, rc, rssi, read_time) VALUES ('T1', 'A1', 1, -50, ?)",
+                    (aware.isoformat(sep=' '),)
+                )
+                stored = [r[0] for r in conn.execute("SELECT read_ts FROM record ORDER BY record_id")]
+                times = [r.read_time for r in get_records_by_tag(conn, "T1")]
+        finally:
+            db_module.db_path.reset(token)
+        assert stored == [_to_ts(naive), _to_ts(aware), _to_ts(aware)]
+        assert times == [naive, aware, aware]
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+
+
+def test_record_read_time_independent_of_reader_timezone(monkeypatch):
+    # 读回的时间与写入的文本一致，不受读取方主机时区（含夏令时间隙）影响
+    written = [datetime(2025, 5, 1, 12, 0), datetime(2025, 3, 9, 2, 30)]
+    try:
+        monkeypatch.setenv("TZ", "Asia/Shanghai")
+        time.tzset()
+        with db_module.get_connection() as conn:
+            insert_antenna(conn, Antenna(antenna_id="A1", x=0.0, y=0.0))
+            insert_tag(conn, Tag(tag_id="T1", type="tar"))
+            for dt in written:
+                insert_record(conn, Record(tag_id="T1", antenna_id="A1", rc=1, rssi=-50.0, read_time=dt))
+        for tz in ("UTC", "America/New_York"):
+            monkeypatch.setenv("TZ", tz)
+            time.tzset()
+            with db_module.get_connection() as conn:
+                assert [r.read_time for r in get_records_by_tag(conn, "T1")] == written
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
@@ -1,6 +1,11 @@
 import pytest
 import json
+import asyncio
+import sqlite3
+import httpx
 from pathlib import Path
+from collections import deque
+from types import SimpleNamespace
 from datetime import datetime
 import pytest_asyncio
 
@@ -10,44 +15,68 @@ from src.repository import get_records_by_tag, insert_antenna, insert_tag
 from src.models import Antenna, Tag, Record
 from src.db import get_connection
 
-# 使用文件数据库进行测试，避免使用内存数据库
+# 使用会话级内存数据库（见 conftest.py），每个测试前清空
 @pytest.fixture(autouse=True)
-def init_db(tmp_path):
-    test_db = tmp_path / "test_tagsee.db"
-    # 覆盖模块中的 DB_PATH
-    db_module.DB_PATH = str(test_db)
-    # 重新初始化数据库
-    db_module.initialize_database()
+def init_db(clean_db):
     yield
 
+
+async def noop_reading(self, ip):
+    # 替代 start_reading/stop_reading 的空操作
+    return None
+
 @pytest.mark.asyncio
-async def test_rest_api_methods(monkeypatch):
+async def test_rest_api_methods():
     client = TagSeeClient(host="testhost", port=1234)
+    requested = []
 
-    # 模拟 HTTP 响应对象
-    class DummyResp:
-        def __init__(self, data):
-            self._data = data
-        def raise_for_status(self):
-            pass
-        def json(self):
-            return self._data
+    # 用 MockTransport 模拟 TagSee REST 服务
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append((request.method, request.url.path))
+        if request.url.path == "/service/discover":
+            return httpx.Response(200, json={"errorCode":0, "agents":[{"ip":"1.2.3.4","name":"R1","remark":""}]})
+        return httpx.Response(200, json={"errorCode":0})
+
+    client._client = httpx.AsyncClient(
+        base_url=client.base_url, transport=httpx.MockTransport(handler)
+    )
 
     # discover_agents
-    monkeypatch.setattr("requests.get", lambda url: DummyResp({"errorCode":0, "agents":[{"ip":"1.2.3.4","name":"R1","remark":""}]}))
-    agents = client.discover_agents()
+    agents = await client.discover_agents()
     assert agents == [{"ip":"1.2.3.4","name":"R1","remark":""}]
 
-    # create_agent, update_agent, remove_agent
-    monkeypatch.setattr("requests.post", lambda url, json=None: DummyResp({"errorCode":0}))
-    client.create_agent("1.2.3.4", "R1", "remark1")
-    client.update_agent("1.2.3.4", "R1-upd", "remark2")
-    client.remove_agent("1.2.3.4")
+    # create_agent, update_agent, remove_agent：共用连接池并发请求
+    await client.create_agent("1.2.3.4", "R1", "remark1")
+    await asyncio.gather(
+        client.update_agent("1.2.3.4", "R1-upd", "remark2"),
+        client.remove_agent("1.2.3.4"),
+    )
 
     # start_reading, stop_reading
-    monkeypatch.setattr("requests.get", lambda url: DummyResp({"errorCode":0}))
-    client.start_reading("1.2.3.4")
-    client.stop_reading("1.2.3.4")
+    await client.start_reading("1.2.3.4")
+    await client.stop_reading("1.2.3.4")
+    await client.aclose()
+
+    assert set(requested) == {
+        ("GET", "/service/discover"),
+        ("POST", "/service/agent/create"),
+        ("POST", "/service/agent/1.2.3.4/update"),
+        ("POST", "/service/agent/1.2.3.4/remove"),
+        ("GET", "/service/agent/1.2.3.4/start"),
+        ("GET", "/service/agent/1.2.3.4/stop"),
+    }
+
+
+@pytest.mark.asyncio
+async def test_rest_api_error_code():
+    client = TagSeeClient(host="testhost", port=1234)
+    client._client = httpx.AsyncClient(
+        base_url=client.base_url,
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"errorCode":1}))
+    )
+    with pytest.raises(RuntimeError):
+        await client.start_reading("1.2.3.4")
+    await client.aclose()
 
 @pytest.mark.asyncio
 async def test_readings_stream_and_collect(monkeypatch):
@@ -66,7 +95,7 @@ async def test_readings_stream_and_collect(monkeypatch):
     # Dummy WebSocket 上下文管理器和异步迭代器
     class DummyWS:
         def __init__(self, url):
-            self._iter = iter(messages)
+            self._queue = deque(messages)
         async def __aenter__(self):
             return self
         async def __aexit__(self, exc_type, exc, tb):
@@ -74,16 +103,15 @@ async def test_readings_stream_and_collect(monkeypatch):
         def __aiter__(self):
             return self
         async def __anext__(self):
-            try:
-                return next(self._iter)
-            except StopIteration:
+            if not self._queue:
                 raise StopAsyncIteration
+            return self._queue.popleft()
 
     # Monkey-patch websockets.connect
     monkeypatch.setattr("websockets.connect", lambda url: DummyWS(url))
     # 将 start_reading/stop_reading 设置为空操作
-    monkeypatch.setattr(TagSeeClient, "start_reading", lambda self, ip: None)
-    monkeypatch.setattr(TagSeeClient, "stop_reading", lambda self, ip: None)
+    monkeypatch.setattr(TagSeeClient, "start_reading", noop_reading)
+    monkeypatch.setattr(TagSeeClient, "stop_reading", noop_reading)
 
     # 调用 collect_and_store_records，并验证数据已写入数据库
     with get_connection() as conn:
@@ -99,3 +127,115 @@ async def test_readings_stream_and_collect(monkeypatch):
         assert rec.rssi == -55.2
         # 根据默认 rc=1
         assert rec.rc == 1
+
+
+@pytest.mark.asyncio
+async def test_collect_flushes_in_batches(monkeypatch):
+    # 多帧读数按 flush_size 合并写入，流结束时写入剩余缓冲
+    async def fake_stream(self):
+        for i in range(5):
+            yield [Record(tag_id="T1", antenna_id="1", rc=1, rssi=-50.0 - i)]
+
+    flushed = []
+    import src.services.tagsee as tagsee_module
+    real_insert = tagsee_module.insert_records
+    def spy_insert(conn, recs):
+        flushed.append(len(recs))
+        real_insert(conn, recs)
+
+    monkeypatch.setattr(TagSeeClient, "readings_stream", fake_stream)
+    monkeypatch.setattr(TagSeeClient, "start_reading", noop_reading)
+    monkeypatch.setattr(TagSeeClient, "stop_reading", noop_reading)
+    monkeypatch.setattr(tagsee_module, "insert_records", spy_insert)
+
+    with get_connection() as conn:
+        insert_antenna(conn, Antenna(antenna_id="1", x=0.0, y=0.0))
+        insert_tag(conn, Tag(tag_id="T1", type="tar"))
+        await collect_and_store_records("1.2.3.4", conn, flush_size=2, flush_interval=60)
+        assert flushed == [2, 2, 1]
+        assert len(get_records_by_tag(conn, "T1")) == 5
+
+
+@pytest.mark.asyncio
+async def test_collect_stops_reading_when_flush_fails(monkeypatch):
+    # 未知标签触发外键错误：回滚本批写入，仍然停止读取并关闭客户端
+    async def fake_stream(self):
+        yield [Record(tag_id="T1", antenna_id="1", rc=1, rssi=-50.0)]
+        yield [Record(tag_id="UNKNOWN", antenna_id="1", rc=1, rssi=-51.0)]
+
+    calls = []
+    async def fake_start(self, ip):
+        calls.append("start")
+    async def fake_stop(self, ip):
+        calls.append("stop")
+    async def fake_aclose(self):
+        calls.append("aclose")
+
+    monkeypatch.setattr(TagSeeClient, "readings_stream", fake_stream)
+    monkeypatch.setattr(TagSeeClient, "start_reading", fake_start)
+    monkeypatch.setattr(TagSeeClient, "stop_reading", fake_stop)
+    monkeypatch.setattr(TagSeeClient, "aclose", fake_aclose)
+
+    with get_connection() as conn:
+        insert_antenna(conn, Antenna(antenna_id="1", x=0.0, y=0.0))
+        insert_tag(conn, Tag(tag_id="T1", type="tar"))
+        conn.commit()
+        with pytest.raises(sqlite3.IntegrityError):
+            await collect_and_store_records("1.2.3.4", conn, flush_size=2, flush_interval=60)
+        assert calls == ["start", "stop", "aclose"]
+        # 整批回滚，连接上没有残留的未提交写入
+        assert not conn.in_transaction
+        assert get_records_by_tag(conn, "T1") == []
+
+
+@pytest.mark.asyncio
+async def test_collect_time_limits_without_frames(monkeypatch):
+    # 读写器只发心跳（无读数帧）时，flush_interval 和 duration 仍按时生效。
+    # 使用可控时钟：等待超时时直接拨快时钟，不依赖真实耗时
+    import src.services.tagsee as tagsee_module
+    clock = [0.0]
+    idle = asyncio.Event()
+    events = []
+
+    async def quiet_stream(self):
+        try:
+            yield [Record(tag_id="T1", antenna_id="1", rc=1, rssi=-50.0)]
+            # 此后只有心跳，不再产生读数帧
+            idle.set()
+            await asyncio.Event().wait()
+            yield []
+        finally:
+            events.append(("stream closed", clock[0]))
+
+    async def fake_wait(fs, timeout=None):
+        # 等到读数帧就绪或数据流进入空闲，再把时钟拨到超时时刻
+        while not idle.is_set() and not any(f.done() for f in fs):
+            await asyncio.sleep(0)
+        done = {f for f in fs if f.done()}
+        if not done and timeout is not None:
+            clock[0] += timeout
+        return done, set(fs) - done
+
+    real_insert = tagsee_module.insert_records
+    def spy_insert(conn, recs):
+        events.append(("flush", clock[0]))
+        real_insert(conn, recs)
+
+    monkeypatch.setattr(tagsee_module, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    monkeypatch.setattr(tagsee_module, "asyncio", SimpleNamespace(
+        wait=fake_wait, ensure_future=asyncio.ensure_future, gather=asyncio.gather
+    ))
+    monkeypatch.setattr(TagSeeClient, "readings_stream", quiet_stream)
+    monkeypatch.setattr(TagSeeClient, "start_reading", noop_reading)
+    monkeypatch.setattr(TagSeeClient, "stop_reading", noop_reading)
+    monkeypatch.setattr(tagsee_module, "insert_records", spy_insert)
+
+    with get_connection() as conn:
+        insert_antenna(conn, Antenna(antenna_id="1", x=0.0, y=0.0))
+        insert_tag(conn, Tag(tag_id="T1", type="tar"))
+        await collect_and_store_records(
+            "1.2.3.4", conn, flush_size=100, flush_interval=0.05, duration=0.3
+        )
+        assert len(get_records_by_tag(conn, "T1")) == 1
+    # 缓冲在 flush_interval 到期时写入（早于数据流结束），随后由 duration 结束采集
+    assert events == [("flush", pytest.approx(0.05)), ("stream closed", pytest.approx(0.3))]